@@ -5,64 +5,130 @@ import numpy as np
 import folium
 import leafmap.foliumap as leafmap
 from folium.plugins import MarkerCluster, HeatMap
+import branca.colormap
 import tools_imag as ti
 from urllib.parse import quote
 import json
 from dash.exceptions import PreventUpdate
+import hashlib
 import tempfile
+import threading
+import os
+import functools
+from collections import OrderedDict
 
 import base64
 
 
+CACHE_DIR = '.cache'
+
 # Better approach - use global caching
 _cached_data = {
     'corpus': None,
+    'corpus_by_id': None,
     'places': None,
-    'lists': None
+    'name_to_docs': None,
+    'lists': None,
+    'data_version': None
 }
 
 def get_cached_data():
     global _cached_data
     if _cached_data['corpus'] is None:
         # Load data once
-        corpus = pd.read_excel("imag_korpus.xlsx", index_col=0)
-        corpus['author'] = corpus['author'].fillna('').apply(lambda x: x.replace('/', ' '))
-        corpus['Verk'] = corpus.apply(lambda x: f"{x['title'] or 'Uten tittel'} av {x['author'] or 'Ingen'} ({x['year'] or 'n.d.'})", axis=1)
+        corpus, authors, titles, categories = load_corpus()
         
         _cached_data['corpus'] = corpus
-        _cached_data['places'] = pd.read_pickle('exploded_places.pkl')
+        _cached_data['corpus_by_id'] = corpus.set_index('dhlabid', drop=False).sort_index()
+        _cached_data['places'] = load_exploded_places()
+        _cached_data['name_to_docs'] = build_place_index(_cached_data['places'])
         _cached_data['lists'] = {
-            'authors': list(set(corpus.author)),
-            'titles': list(set(corpus.Verk)),
-            'categories': list(set(corpus.category))
+            'authors': authors,
+            'titles': titles,
+            'categories': categories
         }
+        # Maps cached on disk are only valid for the data they were drawn from
+        _cached_data['data_version'] = (file_digest("imag_korpus.xlsx"), file_digest('exploded_places.pkl'))
     return _cached_data
 
 
-_map_cache = {}
+_map_cache = OrderedDict()
+MAP_CACHE_SIZE = 10  # Only keep 10 most recent maps in memory
+# Dash callbacks run on parallel threads; the lock covers lookups and evictions, not rendering
+_map_cache_lock = threading.Lock()
+
+# Rendered maps are also kept on disk so they survive restarts and dev-mode reloads
+MAP_CACHE_DIR = os.path.join(CACHE_DIR, 'maps')
+MAP_DISK_CACHE_SIZE = 200
+# Bump when a change to the map code should invalidate the maps already on disk
+MAP_RENDER_VERSION = 1
 
 def get_cached_map_html(cache_key, create_map_func):
-    global _map_cache
-    if cache_key not in _map_cache:
-        _map_cache[cache_key] = create_map_func()
-    return _map_cache[cache_key]
-
-def clean_map_cache():
-    global _map_cache
-    if len(_map_cache) > 10:  # Only keep 10 most recent maps
-        _map_cache.clear()
-
-def make_map(significant_places, corpus_df, basemap, marker_size, center=None, zoom=None):
-    # Create cache key
-    cache_key = f"{significant_places.shape[0]}_{basemap}_{marker_size}_{center}_{zoom}"
+    with _map_cache_lock:
+        if cache_key in _map_cache:
+            _map_cache.move_to_end(cache_key)
+            return _map_cache[cache_key]
+
+    # Keys are tuples of strings and numbers, so their repr is stable across processes
+    disk_key = (MAP_RENDER_VERSION, get_cached_data()['data_version'], cache_key)
+    path = os.path.join(MAP_CACHE_DIR, hashlib.sha1(repr(disk_key).encode()).hexdigest() + '.html')
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            html_str = f.read()
+    else:
+        html_str = create_map_func()
+        write_map_html(path, html_str)
+
+    with _map_cache_lock:
+        _map_cache[cache_key] = html_str
+        _map_cache.move_to_end(cache_key)
+        while len(_map_cache) > MAP_CACHE_SIZE:
+            _map_cache.popitem(last=False)
+    return html_str
+
+def write_map_html(path, html_str):
+    os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+    # A unique temp file per write, so callbacks on other threads never share one
+    fd, tmp_path = tempfile.mkstemp(dir=MAP_CACHE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(html_str)
+    os.replace(tmp_path, path)
+
+    # Drop the oldest maps once the directory grows past its limit; another thread may prune the same files
+    files = []
+    for name in os.listdir(MAP_CACHE_DIR):
+        if name.endswith('.html'):
+            try:
+                files.append((os.path.getmtime(os.path.join(MAP_CACHE_DIR, name)), name))
+            except FileNotFoundError:
+                pass
+    if len(files) > MAP_DISK_CACHE_SIZE:
+        for _, name in sorted(files)[:len(files) - MAP_DISK_CACHE_SIZE]:
+            try:
+                os.remove(os.path.join(MAP_CACHE_DIR, name))
+            except FileNotFoundError:
+                pass
+
+def marker_radii(frekv, marker_size, max_radius=60):
+    # Plain array in, array out, so it can be compiled or reused without closing over map state
+    return np.minimum(6 + np.log(frekv) * marker_size, max_radius)
+
+def make_map(significant_places, corpus_by_id, basemap, marker_size, center=None, zoom=None):
+    # Create cache key from the place content, not just the row count
+    # The popups list the books behind each place, so the dhlabids belong in the key too
+    key_columns = significant_places[['name', 'token', 'latitude', 'longitude', 'frekv']].assign(
+        dhlabid=significant_places['dhlabid'].map(lambda ids: ','.join(map(str, sorted(ids))))
+    )
+    content_key = int(pd.util.hash_pandas_object(key_columns, index=False).values.sum())
+    cache_key = (content_key, basemap, marker_size, tuple(center) if center else None, zoom)
     
     
     def create_popup_html(place, place_books):
-        html = f"""
+        parts = [f"""
         <div style='width:500px'>
-            <h4>{place['token']}</h4>
-            <p><strong>Moderne navn:</strong> {place['name']}</p>
-            <p><strong>{place['frekv']} forekomster i {len(place_books)} bøker</strong></p>
+            <h4>{place.token}</h4>
+            <p><strong>Moderne navn:</strong> {place.name}</p>
+            <p><strong>{place.frekv} forekomster i {len(place_books)} bøker</strong></p>
             <div style='max-height: 400px; overflow-y: auto;'>
                 <table style='width: 100%; border-collapse: collapse;'>
                     <thead style='position: sticky; top: 0; background: white;'>
@@ -73,11 +139,12 @@ def make_map(significant_places, corpus_df, basemap, marker_size, center=None, z
                         </tr>
                     </thead>
                     <tbody>
-        """
+        """]
         
-        for _, book in place_books.iterrows():
-            book_url = f"https://nb.no/items/{book.urn}?searchText=\"{quote(place['token'])}\""
-            html += f"""
+        search_text = quote(place.token)
+        for book in place_books.itertuples(index=False):
+            book_url = f"https://nb.no/items/{book.urn}?searchText=\"{search_text}\""
+            parts.append(f"""
                 <tr>
                     <td style='border: 1px solid #ddd; padding: 8px;'>
                         <a href='{book_url}' target='_blank'>{book.title}</a>
@@ -85,15 +152,15 @@ def make_map(significant_places, corpus_df, basemap, marker_size, center=None, z
                     <td style='border: 1px solid #ddd; padding: 8px;'>{book.author}</td>
                     <td style='border: 1px solid #ddd; padding: 8px;'>{book.year}</td>
                 </tr>
-            """
+            """)
         
-        html += """
+        parts.append("""
                     </tbody>
                 </table>
             </div>
         </div>
-        """
-        return html
+        """)
+        return "".join(parts)
 
     def create_map():
         significant_places_clean = significant_places.dropna(subset=['latitude', 'longitude'])
@@ -114,30 +181,40 @@ def make_map(significant_places, corpus_df, basemap, marker_size, center=None, z
         for feature_class, description in feature_descriptions.items():
             feature_groups[feature_class] = folium.FeatureGroup(name=description).add_to(m)
 
-        # Process places in batches for better memory management
-        batch_size = 50
-        for i in range(0, len(significant_places), batch_size):
-            batch = significant_places.iloc[i:i+batch_size]
-            
-            for _, place in batch.iterrows():
-                place_books = corpus_df[corpus_df.dhlabid.isin(place['dhlabid'])]
-                book_count = len(place_books)
-                
-                popup_html = create_popup_html(place, place_books)
-                
-                radius = min(6 + np.log(place['frekv']) * marker_size, 60)
-                marker = folium.CircleMarker(
-                    radius=radius,
-                    location=[place['latitude'], place['longitude']],
-                    popup=folium.Popup(popup_html, max_width=500),
-                    tooltip=f"{place['token']}: {place['frekv']} forekomster i {book_count} bøker",
-                    color=feature_colors[place['feature_class']],
-                    fill=True,
-                    fill_color=feature_colors[place['feature_class']],
-                    fill_opacity=0.4,
-                    weight=2
-                )
-                marker.add_to(feature_groups[place['feature_class']])
+        # Marker radii for all places in one vectorized pass
+        radii = marker_radii(significant_places['frekv'].to_numpy(), marker_size)
+
+        # One GeoJSON layer per feature class instead of one folium object per marker
+        features = {feature_class: [] for feature_class in feature_groups}
+        for i, (place, radius) in enumerate(zip(significant_places.itertuples(index=False), radii)):
+            place_books = corpus_by_id.loc[corpus_by_id.index.intersection(place.dhlabid)]
+            features[place.feature_class].append({
+                'type': 'Feature',
+                'id': i,  # folium keys the per-feature styles on this instead of a long property
+                'geometry': {'type': 'Point', 'coordinates': [float(place.longitude), float(place.latitude)]},
+                'properties': {
+                    'radius': float(radius),
+                    'popup': create_popup_html(place, place_books),
+                    'tooltip': f"{place.token}: {place.frekv} forekomster i {len(place_books)} bøker"
+                }
+            })
+
+        for feature_class, class_features in features.items():
+            if not class_features:
+                continue
+            color = feature_colors[feature_class]
+            folium.GeoJson(
+                {'type': 'FeatureCollection', 'features': class_features},
+                marker=folium.CircleMarker(fill=True, fill_opacity=0.4, weight=2),
+                style_function=lambda feature, color=color: {
+                    'radius': feature['properties']['radius'],
+                    'color': color,
+                    'fillColor': color
+                },
+                popup=folium.GeoJsonPopup(fields=['popup'], labels=False, localize=False, max_width=500),
+                tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False),
+                control=False
+            ).add_to(feature_groups[feature_class])
 
         folium.LayerControl(collapsed=False).add_to(m)
         return folium_to_html(m)
@@ -176,25 +253,80 @@ EUROPE_VIEW = {
 
 # Helper function to convert Folium map to HTML string
 def folium_to_html(m):
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.html') as tmp:
-        m.save(tmp.name)
-        with open(tmp.name, 'r', encoding='utf-8') as f:
-            html_str = f.read()
-    return html_str
+    return m.get_root().render()
 
 # Cache functions
+def file_digest(source_file):
+    with open(source_file, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def cache_path(source_file):
+    """Path of the decoded copy of source_file, keyed on its name, mtime and content hash"""
+    digest = file_digest(source_file)
+    stem = os.path.splitext(os.path.basename(source_file))[0]
+    mtime = int(os.path.getmtime(source_file))
+    return os.path.join(CACHE_DIR, f"{stem}_{mtime}_{digest}.pkl")
+
+def prune_cached_frames(stem, keep=None):
+    """Delete decoded copies of stem in CACHE_DIR other than keep"""
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if name.startswith(stem + '_') and name.endswith('.pkl') and path != keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def cached_frame(source_file, build):
+    """Return build(source_file), reusing an uncompressed pickle from CACHE_DIR when the source is unchanged"""
+    path = cache_path(source_file)
+    if os.path.exists(path):
+        return pd.read_pickle(path)
+    df = build(source_file)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    df.to_pickle(path, compression=None)
+    # Copies of earlier versions of the source are never read again
+    prune_cached_frames(os.path.splitext(os.path.basename(source_file))[0], keep=path)
+    return df
+
+def read_corpus_excel(korpus_file):
+    try:
+        corpus = pd.read_excel(korpus_file, index_col=0, engine='calamine')
+    except ImportError:
+        # python-calamine not installed, use the default (openpyxl) reader
+        corpus = pd.read_excel(korpus_file, index_col=0)
+    corpus['author'] = corpus['author'].fillna('').str.replace('/', ' ', regex=False)
+    title = corpus['title'].fillna('Uten tittel').astype(str)
+    author = corpus['author'].replace('', 'Ingen')
+    year = corpus['year'].fillna('n.d.').astype(str)
+    corpus['Verk'] = title + ' av ' + author + ' (' + year + ')'
+    return corpus
+
+
 def load_corpus():
     korpus_file = "imag_korpus.xlsx"
-    corpus = pd.read_excel(korpus_file, index_col=0)
-    corpus['author'] = corpus['author'].fillna('').apply(lambda x: x.replace('/', ' '))
-    corpus['Verk'] = corpus.apply(lambda x: f"{x['title'] or 'Uten tittel'} av {x['author'] or 'Ingen'} ({x['year'] or 'n.d.'})", axis=1)
-    authors = list(set(corpus.author))
-    titles = list(set(corpus.Verk))
-    categories = list(set(corpus.category))
+    corpus = cached_frame(korpus_file, read_corpus_excel)
+    authors = sorted(corpus['author'].dropna().unique().tolist())
+    titles = sorted(corpus['Verk'].dropna().unique().tolist())
+    categories = sorted(corpus['category'].dropna().unique().tolist())
     return corpus, authors, titles, categories
 
 def load_exploded_places():
-    return pd.read_pickle('exploded_places.pkl')
+    # Already a pickle, so it is read directly; a decoded copy would only add a hash and a second read
+    places = pd.read_pickle('exploded_places.pkl')
+    # docs is stored as object dtype; downstream lookups want plain int64
+    places['docs'] = places['docs'].astype('int64')
+    # Remove decoded copies left by earlier versions that cached this file too
+    prune_cached_frames('exploded_places')
+    return places
+
+def build_place_index(places):
+    """Map each place name to the sorted, unique dhlabids of the books mentioning it"""
+    pairs = places[['name', 'docs']].drop_duplicates().sort_values(['name', 'docs'])
+    names, starts = np.unique(pairs['name'].to_numpy(), return_index=True)
+    return dict(zip(names, np.split(pairs['docs'].to_numpy(), starts[1:])))
 
 # Load initial data
 # corpus_df, authorlist, titlelist, categorylist = load_corpus()
@@ -203,10 +335,12 @@ def load_exploded_places():
 
 cached_data = get_cached_data()
 corpus_df = cached_data['corpus']
+corpus_by_id = cached_data['corpus_by_id']
 preprocessed_places = cached_data['places']
 authorlist = cached_data['lists']['authors']
 titlelist = cached_data['lists']['titles']
 categorylist = cached_data['lists']['categories']
+name_to_docs = cached_data['name_to_docs']
 
 
 
@@ -529,56 +663,118 @@ app.clientside_callback(
      Input('places-dropdown', 'value')]
 )
 def interdependent_filters(years, categories, authors, titles, places):
-    # Start with the full dataset
-    filtered_corpus = corpus_df.copy()
+    # Normalize the inputs to hashable keys so repeated filter states hit the cache
+    params = (
+        tuple(years) if years else None,
+        selection_key(categories),
+        selection_key(authors),
+        selection_key(titles),
+        selection_key(places)
+    )
+    stats, filtered_corpus, category_options, author_options, title_options = filter_corpus(*params)
+    if filtered_corpus is None:
+        return stats, [], category_options, author_options, title_options
+
+    # Keep the frame on the server and only send the normalized filter to the browser store;
+    # get_filtered_corpus rebuilds it from there through the filter_corpus cache
+    return stats, list(params), category_options, author_options, title_options
+
+
+def selection_key(values):
+    return tuple(sorted(values)) if values else None
+
+
+def filter_params(stored):
+    # JSON turns the tuples from interdependent_filters into lists; restore them as cache keys
+    return tuple(tuple(p) if p else None for p in stored)
+
+def get_filtered_corpus(stored):
+    if not stored:
+        return None
+    return filter_corpus(*filter_params(stored))[1]
+
+
+def metadata_mask(years=None, categories=None, authors=None, titles=None):
+    # Combine the metadata filters into one boolean mask instead of copying the frame per step
+    mask = np.ones(len(corpus_df), dtype=bool)
 
     # Apply Year Filter
     if years:
-        filtered_corpus = filtered_corpus[
-            (filtered_corpus['year'] >= years[0]) &
-            (filtered_corpus['year'] <= years[1])
-        ]
-
-    # Generate Category Options (before applying Category Filter)
-    category_options = [{'label': cat, 'value': cat} for cat in sorted(filtered_corpus['category'].unique())]
+        year_values = corpus_df['year'].values
+        mask &= (year_values >= years[0]) & (year_values <= years[1])
 
     # Apply Category Filter
     if categories:
-        filtered_corpus = filtered_corpus[filtered_corpus['category'].isin(categories)]
-
-    # Generate Author Options (before applying Author Filter)
-    author_options = [{'label': author, 'value': author} for author in sorted(filtered_corpus['author'].unique())]
+        mask &= corpus_df['category'].isin(categories).values
 
     # Apply Author Filter
     if authors:
-        filtered_corpus = filtered_corpus[filtered_corpus['author'].isin(authors)]
-
-    # Generate Title Options (before applying Title Filter)
-    title_options = [{'label': title, 'value': title} for title in sorted(filtered_corpus['Verk'].unique())]
+        mask &= corpus_df['author'].isin(authors).values
 
     # Apply Title Filter
     if titles:
-        filtered_corpus = filtered_corpus[filtered_corpus['Verk'].isin(titles)]
+        mask &= corpus_df['Verk'].isin(titles).values
+
+    return mask
+
+
+def dropdown_options(values):
+    return tuple({'label': value, 'value': value} for value in sorted(values.unique()))
+
+
+# Each option list only depends on the filters applied before it, so it is cached on those alone
+@functools.lru_cache(maxsize=128)
+def category_options(years):
+    return dropdown_options(corpus_df['category'][metadata_mask(years)])
+
+@functools.lru_cache(maxsize=128)
+def author_options(years, categories):
+    return dropdown_options(corpus_df['author'][metadata_mask(years, categories)])
+
+@functools.lru_cache(maxsize=128)
+def title_options(years, categories, authors):
+    return dropdown_options(corpus_df['Verk'][metadata_mask(years, categories, authors)])
+
+
+@functools.lru_cache(maxsize=64)
+def filter_corpus(years, categories, authors, titles, places):
+    options = (
+        category_options(years),
+        author_options(years, categories),
+        title_options(years, categories, authors)
+    )
+
+    mask = metadata_mask(years, categories, authors, titles)
 
     # Apply Places Filter
     if places:
-        place_books = preprocessed_places[
-            preprocessed_places['name'].isin(places)
-        ]['docs'].unique()
-        filtered_corpus = filtered_corpus[filtered_corpus['dhlabid'].isin(place_books)]
+        # Union the precomputed book ids for the selected places instead of scanning the places table
+        place_books = [name_to_docs[place] for place in places if place in name_to_docs]
+        place_books = np.unique(np.concatenate(place_books)) if place_books else np.array([], dtype='int64')
+        mask &= corpus_df['dhlabid'].isin(place_books).values
+
+    filtered_corpus = corpus_df.loc[mask]
 
     # Safeguard: Handle empty datasets
     if filtered_corpus.empty:
-        return "No data available", [], category_options, author_options, title_options
+        return ("No data available", None) + options
 
     # Update stats
     stats = f"Filtered Corpus: {len(filtered_corpus)} records, {len(filtered_corpus['author'].unique())} authors."
 
-    # Convert filtered data to JSON
-    filtered_data = filtered_corpus.to_json(date_format='iso', orient='split')
+    return (stats, filtered_corpus) + options
+
 
-    return stats, filtered_data, category_options, author_options, title_options
 
+def geo_locations(dhlabids):
+    # Normalize to a frozenset of Python ints so identical id sets share a cache entry
+    return cached_geo_locations(frozenset(int(dhlabid) for dhlabid in dhlabids))
+
+@functools.lru_cache(maxsize=32)
+def cached_geo_locations(dhlabids):
+    places = ti.geo_locations_corpus(sorted(dhlabids))
+    # Only the top ranked place candidate is used downstream
+    return places[places['rank']==1]
 
 
 # Callback to update map view state
@@ -606,21 +802,19 @@ def update_map_view(world_clicks, europe_clicks, current_state):
      Input('basemap-dropdown', 'value'),
      Input('marker-size-slider', 'value')]
 )
-def update_map(filtered_corpus_json, view_state, max_books, max_places, basemap, marker_size):
-    if not filtered_corpus_json:
+def update_map(filter_state, view_state, max_books, max_places, basemap, marker_size):
+    subkorpus = get_filtered_corpus(filter_state)
+    if subkorpus is None:
         raise PreventUpdate
     
-    # Get cached data
-    cached_data = get_cached_data()
-    corpus_df = cached_data['corpus']
-    
-    # Process data efficiently
-    subkorpus = pd.read_json(filtered_corpus_json, orient='split')
-    selected_dhlabids = subkorpus.sample(min(len(subkorpus), max_books)).dhlabid
+    # Sample books if needed, with a fixed seed so the same selection maps to the same cached places
+    if len(subkorpus) > max_books:
+        selected_dhlabids = subkorpus['dhlabid'].sample(max_books, random_state=0)
+    else:
+        selected_dhlabids = subkorpus['dhlabid']
     
     # Use more efficient groupby operations
-    places = ti.geo_locations_corpus(selected_dhlabids)
-    places = places[places['rank']==1]
+    places = geo_locations(selected_dhlabids)
     
     all_places = (places.groupby('name', as_index=False)
         .agg({
@@ -634,14 +828,12 @@ def update_map(filtered_corpus_json, view_state, max_books, max_places, basemap,
     )
     
     # Efficient calculations
-    all_places['dispersion'] = all_places['dhlabid'].apply(len) / len(selected_dhlabids)
+    all_places['dispersion'] = all_places['dhlabid'].str.len() / len(selected_dhlabids)
     all_places['score'] = all_places['frekv']
     significant_places = all_places.nlargest(max_places, 'score')
     
-    result = make_map(significant_places, corpus_df, basemap, marker_size, 
-                     center=view_state['center'], zoom=view_state['zoom'])
-    clean_map_cache()  # Clean cache after generating new map
-    return result
+    return make_map(significant_places, corpus_by_id, basemap, marker_size, 
+                    center=view_state['center'], zoom=view_state['zoom'])
 
 import logging
 logging.basicConfig(level=logging.INFO)
@@ -651,26 +843,24 @@ logging.basicConfig(level=logging.INFO)
     [Input('filtered-corpus', 'data'),
      Input('max-books-slider', 'value')]
 )
-def update_place_summary(filtered_corpus_json, max_books):
+def update_place_summary(filter_state, max_books):
     try:
-        if not filtered_corpus_json:
+        subkorpus = get_filtered_corpus(filter_state)
+        if subkorpus is None:
             return "No places found"
         
-        # Convert filtered corpus back to DataFrame
-        subkorpus = pd.read_json(filtered_corpus_json, orient='split')
         logging.info(f"Corpus size: {len(subkorpus)}")
         
         # Sample books if needed
         if len(subkorpus) > max_books:
-            selected_dhlabids = subkorpus.sample(max_books).dhlabid
+            selected_dhlabids = subkorpus['dhlabid'].sample(max_books, random_state=0)
         else:
             selected_dhlabids = subkorpus.dhlabid
         
         logging.info(f"Selected DhLabIDs: {len(selected_dhlabids)}")
         
         # Get and process places
-        places = ti.geo_locations_corpus(selected_dhlabids)
-        places = places[places['rank']==1]
+        places = geo_locations(selected_dhlabids)
         
         logging.info(f"Places found: {len(places)}")
         
@@ -699,6 +889,52 @@ def update_place_summary(filtered_corpus_json, max_books):
         logging.error(f"Error in place summary: {e}")
         return html.Div(f"Error generating place summary: {str(e)}")
 
+# Above this many points the heatmap is drawn server-side as a single image overlay
+HEATMAP_RASTER_THRESHOLD = 20000
+
+def mercator_y(lat):
+    lat = np.radians(np.clip(lat, -85, 85))
+    return np.log(np.tan(np.pi / 4 + lat / 2))
+
+def rasterize_heatmap(lat, lon, weight, radius, blur, gradient, width=1024, min_opacity=0.3):
+    """Render weighted points to an RGBA image and its lat/lon bounds for folium's ImageOverlay"""
+    # Bin in web mercator space, since Leaflet stretches overlays linearly in projected coordinates
+    x = np.radians(lon)
+    y = mercator_y(lat)
+    x_min, x_max = x.min(), x.max()
+    y_min, y_max = y.min(), y.max()
+    pad = 0.05 * max(x_max - x_min, y_max - y_min, 0.01)
+    x_min, x_max, y_min, y_max = x_min - pad, x_max + pad, y_min - pad, y_max + pad
+    height = max(1, int(width * (y_max - y_min) / (x_max - x_min)))
+
+    grid, _, _ = np.histogram2d(y, x, bins=(height, width), range=[[y_min, y_max], [x_min, x_max]], weights=weight)
+
+    # Gaussian smoothing, roughly matching the radius and blur of the client-side heatmap
+    sigma = max(1.0, (radius + blur) / 4)
+    offsets = np.arange(-int(3 * sigma), int(3 * sigma) + 1)
+    kernel = np.exp(-offsets ** 2 / (2 * sigma ** 2))
+    kernel /= kernel.sum()
+    grid = np.apply_along_axis(np.convolve, 0, grid, kernel, mode='same')
+    grid = np.apply_along_axis(np.convolve, 1, grid, kernel, mode='same')
+
+    density = grid / grid.max() if grid.max() > 0 else grid
+
+    # Colour lookup table built from the same gradient stops as HeatMap
+    stops = sorted(gradient)
+    colormap = branca.colormap.LinearColormap([gradient[stop] for stop in stops], index=stops, vmin=stops[0], vmax=stops[-1])
+    levels = np.clip(np.linspace(0, 1, 256), stops[0], stops[-1])
+    lut = (np.array([colormap.rgba_floats_tuple(level) for level in levels]) * 255).astype(np.uint8)
+
+    image = lut[(density * 255).astype(np.uint8)]
+    image[..., 3] = np.where(density > 0.01, (min_opacity + (1 - min_opacity) * density) * 255, 0).astype(np.uint8)
+
+    lat_bounds = np.degrees(2 * np.arctan(np.exp([y_min, y_max])) - np.pi / 2)
+    lon_bounds = np.degrees([x_min, x_max])
+    bounds = [[lat_bounds[0], lon_bounds[0]], [lat_bounds[1], lon_bounds[1]]]
+    # Row 0 of the histogram is the southern edge; images are drawn from the top
+    return image[::-1], bounds
+
+
 @callback(
     Output('heatmap-iframe', 'srcDoc'),
     [Input('filtered-corpus', 'data'),
@@ -707,62 +943,59 @@ def update_place_summary(filtered_corpus_json, max_books):
      Input('heatmap-blur-slider', 'value'),
      Input('heatmap-color-scheme', 'value')]
 )
-def generate_heatmap(filtered_corpus_json, intensity, radius, blur, color_scheme):
+def generate_heatmap(filter_state, intensity, radius, blur, color_scheme):
     try:
-        if not filtered_corpus_json:
+        subkorpus = get_filtered_corpus(filter_state)
+        if subkorpus is None:
             raise PreventUpdate
         
-        # Convert filtered corpus back to DataFrame
-        subkorpus = pd.read_json(filtered_corpus_json, orient='split')
-        
-        # Convert dhlabid to standard Python int
-        subkorpus['dhlabid'] = subkorpus['dhlabid'].astype(int)
-        dhlabids = subkorpus['dhlabid'].tolist()  # Convert to regular Python list
-        
-        # Get all places for the corpus
-        places = ti.geo_locations_corpus(dhlabids)
-        places = places[places['rank']==1]
-        
-        # Force conversion of numeric columns to float
-        places['latitude'] = places['latitude'].astype(float)
-        places['longitude'] = places['longitude'].astype(float)
-        places['frekv'] = places['frekv'].astype(float)
-        
-        # Create heatmap data directly without using apply
-        heatmap_data = []
-        for _, row in places.iterrows():
-            freq = float(row['frekv'])
-            if freq > 0:  # Only add points with frequency
-                heatmap_data.append([
-                    float(row['latitude']),
-                    float(row['longitude']),
-                    float(np.log1p(freq)) * float(intensity)
-                ])
-        
-        # Define color schemes
-        color_schemes = {
-            'blue-lime-red': {0.4: 'blue', 0.65: 'lime', 1: 'red'},
-            'yellow-red': {0.4: '#ffffb2', 0.65: '#fd8d3c', 1: '#bd0026'},
-            'blue-purple': {0.4: '#7fcdbb', 0.65: '#2c7fb8', 1: '#253494'}
-        }
-        
-        # Create map
-        m = folium.Map(
-            location=[55, 15],
-            zoom_start=4,
-            tiles='CartoDB.Positron'
-        )
-        
-        # Add heatmap layer
-        HeatMap(
-            heatmap_data,
-            radius=int(radius),
-            blur=int(blur),
-            gradient=color_schemes[color_scheme],
-            min_opacity=0.3
-        ).add_to(m)
-        
-        return folium_to_html(m)
+        def create_heatmap():
+            # Convert dhlabid to standard Python int (without touching the shared frame)
+            dhlabids = subkorpus['dhlabid'].astype(int).tolist()  # Convert to regular Python list
+            
+            # Get all places for the corpus
+            places = geo_locations(dhlabids)
+            
+            # Only add points with frequency
+            places = places[places['frekv'] > 0]
+            
+            lat = places['latitude'].to_numpy(dtype=np.float64)
+            lon = places['longitude'].to_numpy(dtype=np.float64)
+            weight = np.log1p(places['frekv'].to_numpy(dtype=np.float64)) * float(intensity)
+            
+            # Define color schemes
+            color_schemes = {
+                'blue-lime-red': {0.4: 'blue', 0.65: 'lime', 1: 'red'},
+                'yellow-red': {0.4: '#ffffb2', 0.65: '#fd8d3c', 1: '#bd0026'},
+                'blue-purple': {0.4: '#7fcdbb', 0.65: '#2c7fb8', 1: '#253494'}
+            }
+            
+            # Create map
+            m = folium.Map(
+                location=[55, 15],
+                zoom_start=4,
+                tiles='CartoDB.Positron'
+            )
+            
+            if len(lat) > HEATMAP_RASTER_THRESHOLD:
+                # Too many points for the browser: render the density image here
+                image, bounds = rasterize_heatmap(lat, lon, weight, radius, blur, color_schemes[color_scheme])
+                folium.raster_layers.ImageOverlay(image=image, bounds=bounds, pixelated=False).add_to(m)
+            else:
+                # Add heatmap layer
+                HeatMap(
+                    np.column_stack((lat, lon, weight)).tolist(),
+                    radius=int(radius),
+                    blur=int(blur),
+                    gradient=color_schemes[color_scheme],
+                    min_opacity=0.3
+                ).add_to(m)
+            
+            return folium_to_html(m)
+
+        # The normalized filter inputs identify the subcorpus across restarts
+        cache_key = ('heatmap', filter_params(filter_state), intensity, radius, blur, color_scheme)
+        return get_cached_map_html(cache_key, create_heatmap)
         
     except Exception as e:
         logging.error(f"Error generating heatmap: {e}")
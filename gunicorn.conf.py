@@ -0,0 +1,9 @@
+import os
+
+# Cloud Run gives one vCPU per instance; requests are IO-bound, so use threads rather than processes
+bind = f"0.0.0.0:{os.environ.get('PORT', '8050')}"
+workers = 1
+threads = 16
+worker_class = "gthread"
+timeout = 120
+preload_app = True
@@ -4,6 +4,15 @@ from flask_cors import CORS, cross_origin
 app = Flask(__name__)
 CORS(app)
 
+# Responses only change on redeploy, so let browsers and shared caches reuse them
+CACHE_MAX_AGE = 3600
+
+@app.after_request
+def add_cache_headers(response):
+    if response.status_code == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = CACHE_MAX_AGE
+    return response
 
 
 @app.route('/helloworld/')
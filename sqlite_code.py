@@ -2,16 +2,48 @@ import dash
 from dash import dcc, html, Input, Output, State, callback, dash_table
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 import folium
+import branca.colormap
 import leafmap.foliumap as leafmap
 from folium.plugins import MarkerCluster, HeatMap
+import plotly.graph_objs as go
 from urllib.parse import quote
 import json
 from dash.exceptions import PreventUpdate
-import tempfile
 import sqlite3
 import base64
+import hashlib
+import io
 import os
+import queue
+import threading
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# Long-lived read-only connections kept per database; the app never writes, so no writer lock is needed
+POOL_SIZE = os.cpu_count() or 4
+SQLITE_PRAGMAS = [
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+]
+# Indexes for the hot lookups; the dhlabid index on places covers the join in get_filtered_places
+CORPUS_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_metadata_dhlabid ON metadata(dhlabid)",
+    "CREATE INDEX IF NOT EXISTS ix_metadata_category ON metadata(category)",
+    "CREATE INDEX IF NOT EXISTS ix_metadata_year ON metadata(year)",
+    "CREATE INDEX IF NOT EXISTS ix_metadata_author ON metadata(author)",
+    "CREATE INDEX IF NOT EXISTS ix_metadata_title ON metadata(title)",
+]
+PLACES_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_places_dhlabid ON places(dhlabid, token, name, freq, lat, lon, feature_class)",
+    "CREATE INDEX IF NOT EXISTS ix_places_token ON places(token, dhlabid)",
+]
 
 
 class DataLayer:
@@ -23,122 +55,160 @@ class DataLayer:
         self.places_db = places_db
         self._cached_lists = {}
         self._corpus_stats = None
+        self._pools = {
+            corpus_db: queue.Queue(maxsize=POOL_SIZE),
+            places_db: queue.Queue(maxsize=POOL_SIZE),
+        }
+        
+        # Indexes and planner statistics are the only writes, done once on plain connections
+        con_corpus = sqlite3.connect(self.corpus_db)
+        con_places = sqlite3.connect(self.places_db)
+        try:
+            self._ensure_indexes(con_corpus, con_places)
+            self._optimize(con_corpus)
+            self._optimize(con_places)
+        finally:
+            con_corpus.close()
+            con_places.close()
         
         # Initialize cache on startup
-        with sqlite3.connect(self.corpus_db) as con:
-            self._initialize_cache(con)
+        self._initialize_cache()
+    
+    @staticmethod
+    def _readonly_uri(db_path):
+        # immutable=1 lets SQLite skip file locking; the files don't change while the app runs
+        return f"{Path(db_path).resolve().as_uri()}?mode=ro&immutable=1"
+    
+    def _connect(self, db_path):
+        """Open a read-only connection that can be handed between Dash worker threads"""
+        con = sqlite3.connect(self._readonly_uri(db_path), uri=True, check_same_thread=False)
+        for pragma in SQLITE_PRAGMAS:
+            con.execute(pragma)
+        if db_path == self.corpus_db:
+            # Corpus queries can then join against places directly as p.places
+            con.execute("ATTACH DATABASE ? AS p", (self._readonly_uri(self.places_db),))
+        return con
+    
+    def _ensure_indexes(self, con_corpus, con_places):
+        """Create missing lookup indexes and gather statistics for any new ones"""
+        for con, statements in [(con_corpus, CORPUS_INDEXES), (con_places, PLACES_INDEXES)]:
+            existing = con.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index'").fetchone()[0]
+            try:
+                for statement in statements:
+                    con.execute(statement)
+                if con.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index'").fetchone()[0] > existing:
+                    con.execute("ANALYZE")
+                con.commit()
+            except sqlite3.OperationalError:
+                # Read-only database files keep whatever indexes they were shipped with
+                con.rollback()
+    
+    def _optimize(self, con):
+        """Run PRAGMA optimize; skipped quietly if the database file is read-only"""
+        try:
+            con.execute("PRAGMA optimize")
+        except sqlite3.OperationalError:
+            pass
     
-    def _initialize_cache(self, con):
+    @contextmanager
+    def _connection(self, db_path):
+        """Check a pooled connection out for the duration of a with-block"""
+        pool = self._pools[db_path]
+        try:
+            con = pool.get_nowait()
+        except queue.Empty:
+            con = self._connect(db_path)
+        try:
+            yield con
+        finally:
+            try:
+                pool.put_nowait(con)
+            except queue.Full:
+                con.close()
+    
+    def _fetch_rows(self, db_path, query):
+        """Run a standalone query on a pooled connection"""
+        with self._connection(db_path) as con:
+            return con.execute(query).fetchall()
+    
+    def _initialize_cache(self):
         """Initialize cached values for dropdowns and corpus stats"""
-        # First get basic stats from metadata
-        for column in ['category', 'year']:
-            self._cached_lists[column] = pd.read_sql_query(
-                f"SELECT DISTINCT {column} FROM metadata WHERE {column} IS NOT NULL ORDER BY {column}",
-                con
-            )[column].tolist()
-        
-        # Initialize corpus stats from metadata
-        self._corpus_stats = {
-            'total_books': pd.read_sql_query(
-                "SELECT COUNT(DISTINCT dhlabid) as count FROM metadata", 
-                con
-            ).iloc[0]['count'],
-            'year_range': pd.read_sql_query(
-                "SELECT MIN(year) as min_year, MAX(year) as max_year FROM metadata", 
-                con
-            ).iloc[0].to_dict()
-        }
-        
-        # Get dhlabids that have places
-        with sqlite3.connect(self.places_db) as places_con:
-            place_dhlabids = pd.read_sql_query(
-                "SELECT DISTINCT dhlabid FROM places",
-                places_con
-            )['dhlabid'].tolist()
+        # The startup queries are independent, and sqlite3 releases the GIL while they run
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            # Basic lists and stats from metadata
+            lists = {
+                column: executor.submit(
+                    self._fetch_rows, self.corpus_db,
+                    f"SELECT DISTINCT {column} FROM metadata WHERE {column} IS NOT NULL ORDER BY {column}"
+                )
+                for column in ['category', 'year']
+            }
+            year_range = executor.submit(
+                self._fetch_rows, self.corpus_db, "SELECT MIN(year), MAX(year) FROM metadata"
+            )
+            total_books = executor.submit(
+                self._fetch_rows, self.corpus_db, "SELECT COUNT(DISTINCT dhlabid) FROM metadata"
+            )
+            
+            # Place names for the searchable dropdown; their count is the total places stat
+            lists['token'] = executor.submit(
+                self._fetch_rows, self.places_db,
+                "SELECT DISTINCT token FROM places WHERE token IS NOT NULL ORDER BY token"
+            )
             
-            # Get total places count
-            self._corpus_stats['total_places'] = pd.read_sql_query(
-                "SELECT COUNT(DISTINCT token) as count FROM places",
-                places_con
-            ).iloc[0]['count']
+            # Authors and titles are limited to documents that have places
+            place_dhlabids = [row[0] for row in self._fetch_rows(
+                self.places_db, "SELECT DISTINCT dhlabid FROM places"
+            )]
+            for column in ['author', 'title']:
+                lists[column] = executor.submit(
+                    self._query_for_ids,
+                    f"""
+                    SELECT DISTINCT {column} 
+                    FROM metadata 
+                    WHERE dhlabid IN ({{}})
+                    AND {column} IS NOT NULL
+                    ORDER BY {column}
+                    """,
+                    place_dhlabids,
+                    self.corpus_db
+                )
         
-        # Now get authors and titles that have place mentions
-        place_ids_str = ','.join('?' * len(place_dhlabids))
-        self._cached_lists['author'] = pd.read_sql_query(
-            f"""
-            SELECT DISTINCT author 
-            FROM metadata 
-            WHERE dhlabid IN ({place_ids_str})
-            AND author IS NOT NULL
-            ORDER BY author
-            """,
-            con,
-            params=place_dhlabids
-        )['author'].tolist()
+        for column, future in lists.items():
+            self._cached_lists[column] = [row[0] for row in future.result()]
         
-        self._cached_lists['title'] = pd.read_sql_query(
-            f"""
-            SELECT DISTINCT title 
-            FROM metadata 
-            WHERE dhlabid IN ({place_ids_str})
-            AND title IS NOT NULL
-            ORDER BY title
-            """,
-            con,
-            params=place_dhlabids
-        )['title'].tolist()
-            
-        # Initialize corpus stats
+        min_year, max_year = year_range.result()[0]
         self._corpus_stats = {
-            'total_books': pd.read_sql_query(
-                "SELECT COUNT(DISTINCT dhlabid) as count FROM metadata", 
-                con
-            ).iloc[0]['count'],
-            'year_range': pd.read_sql_query(
-                "SELECT MIN(year) as min_year, MAX(year) as max_year FROM metadata", 
-                con
-            ).iloc[0].to_dict()
+            'total_books': total_books.result()[0][0],
+            'year_range': {'min_year': min_year, 'max_year': max_year},
+            'total_places': len(self._cached_lists['token'])
         }
-        
-        # Get total places count from places database
-        with sqlite3.connect(self.places_db) as places_con:
-            self._corpus_stats['total_places'] = pd.read_sql_query(
-                "SELECT COUNT(DISTINCT token) as count FROM places", 
-                places_con
-            ).iloc[0]['count']
     
     def get_corpus_stats(self):
         """Return basic statistics about the entire corpus"""
         return self._corpus_stats
     
-    def _execute_batched_query(self, base_query, id_list, db_path, extra_params=None, batch_size=499):
-        """Execute a query in batches to avoid SQLite parameter limits"""
-        all_results = []
-        extra_params = extra_params or []
-        
-        # Process in batches
-        for i in range(0, len(id_list), batch_size):
-            batch = id_list[i:i + batch_size]
-            
-            # Create the IN clause for this batch
-            placeholders = ','.join('?' * len(batch))
-            query = base_query.format(placeholders)
-            
-            # Combine batch IDs with any extra parameters
-            params = batch + extra_params
-            
-            with sqlite3.connect(db_path) as con:
-                batch_df = pd.read_sql_query(query, con, params=params)
-                all_results.append(batch_df)
-        
-        # Combine all results
-        if all_results:
-            return pd.concat(all_results, ignore_index=True)
-        return pd.DataFrame()
+    def _fill_temp_table(self, con, table, column_def, rows):
+        """Load rows into a per-connection temp table; callers roll back to empty it"""
+        con.execute(f"CREATE TEMP TABLE IF NOT EXISTS {table} ({column_def})")
+        con.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?)", rows)
+    
+    def _query_for_ids(self, base_query, id_list, db_path, extra_params=None):
+        """Run a query whose {} placeholder selects from a temp table of ids, returning rows"""
+        with self._connection(db_path) as con:
+            try:
+                self._fill_temp_table(con, '_ids', 'id INTEGER PRIMARY KEY', ((int(x),) for x in id_list))
+                return con.execute(
+                    base_query.format("SELECT id FROM _ids"),
+                    extra_params or []
+                ).fetchall()
+            finally:
+                # Rolling back the implicit transaction empties _ids for the next caller
+                con.rollback()
 
-    def get_filtered_corpus_ids(self, years=None, categories=None, authors=None, titles=None, sample_size=None):
-        """Get dhlabids for filtered corpus with optional sampling"""
-        query_parts = ["SELECT dhlabid FROM metadata WHERE 1=1"]
+    def _metadata_filter(self, years=None, categories=None, authors=None, titles=None, place_tokens=None):
+        """Build the metadata WHERE clause and its parameters for the sidebar filters"""
+        query_parts = ["1=1"]
         params = []
         
         if years:
@@ -162,28 +232,65 @@ class DataLayer:
                 f"AND title IN ({','.join('?' for _ in titles)})"
             )
             params.extend(titles)
-            
-        # Add sampling if requested
-        if sample_size:
-            query_parts.append("ORDER BY RANDOM() LIMIT ?")
-            params.append(sample_size)
-            
-        query = " ".join(query_parts)
         
-        with sqlite3.connect(self.corpus_db) as con:
-            df = pd.read_sql_query(query, con, params=params)
-            return df['dhlabid'].tolist()
-            
-        # Add sampling if requested
+        if place_tokens:
+            query_parts.append(
+                "AND dhlabid IN (SELECT dhlabid FROM p.places WHERE token IN (SELECT tok FROM _tokens))"
+            )
+        
+        return " ".join(query_parts), params
+    
+    def _query_filtered(self, query, params, place_tokens=None):
+        """Run a query built on _metadata_filter, loading the place tokens it refers to"""
+        with self._connection(self.corpus_db) as con:
+            try:
+                if place_tokens:
+                    self._fill_temp_table(con, '_tokens', 'tok TEXT PRIMARY KEY', ((t,) for t in place_tokens))
+                return con.execute(query, params).fetchall()
+            finally:
+                con.rollback()
+    
+    def get_filtered_places(self, years=None, categories=None, authors=None, titles=None, sample_size=None,
+                            place_tokens=None):
+        """Get the filtered (and sampled) dhlabids together with their places and the book year in one query"""
+        where, params = self._metadata_filter(years, categories, authors, titles, place_tokens)
+        sampling = ""
         if sample_size:
-            query_parts.append("ORDER BY RANDOM() LIMIT ?")
+            sampling = "ORDER BY RANDOM() LIMIT ?"
             params.append(sample_size)
-            
-        query = " ".join(query_parts)
         
-        with sqlite3.connect(self.corpus_db) as con:
-            df = pd.read_sql_query(query, con, params=params)
-            return df['dhlabid'].tolist()
+        # The LEFT JOIN keeps documents without places so they still count as selected;
+        # their rows come back with a NULL token
+        query = f"""
+        WITH filtered AS (
+            SELECT dhlabid, year FROM metadata WHERE {where} {sampling}
+        )
+        SELECT
+            f.dhlabid,
+            pl.token,
+            pl.name as modern_name,
+            pl.freq,
+            pl.lat,
+            pl.lon,
+            pl.feature_class,
+            f.year
+        FROM filtered f
+        LEFT JOIN p.places pl ON pl.dhlabid = f.dhlabid
+        """
+        
+        frame = pd.DataFrame.from_records(
+            self._query_filtered(query, params, place_tokens),
+            columns=['dhlabid', 'token', 'modern_name', 'freq', 'lat', 'lon', 'feature_class', 'year']
+        )
+        dhlabids = frame['dhlabid'].unique().tolist()
+        # Place names repeat across books; as categories they group on integer codes and
+        # go into the stores as Arrow dictionaries
+        places = (frame[frame['token'].notna()]
+                  .reset_index(drop=True)
+                  .astype({'dhlabid': 'int32', 'freq': 'int32', 'lat': 'float64', 'lon': 'float64',
+                           'year': 'int16', 'token': 'category', 'modern_name': 'category',
+                           'feature_class': 'category'}))
+        return dhlabids, places
 
     def get_unique_values(self, column):
         """Get cached unique values for dropdowns"""
@@ -191,82 +298,37 @@ class DataLayer:
     
     def get_unique_places(self):
         """Get list of unique place names for dropdown"""
-        query = """
-        SELECT DISTINCT token 
-        FROM places 
-        WHERE token IS NOT NULL 
-        ORDER BY token
-        """
-        with sqlite3.connect(self.places_db) as con:
-            df = pd.read_sql_query(query, con)
-            return df['token'].tolist()
-            
-    def filter_by_places(self, dhlabids, place_tokens=None):
-        """Filter corpus by specific place mentions"""
-        if not place_tokens:
-            return dhlabids
+        return self._cached_lists['token']
             
-        base_query = """
-        SELECT DISTINCT dhlabid 
-        FROM places 
-        WHERE token IN ({}) 
-        AND dhlabid IN ({})
-        """
-        
-        return self._execute_batched_query(
-            base_query=base_query,
-            id_list=dhlabids,
-            db_path=self.places_db,
-            extra_params=place_tokens
-        )['dhlabid'].tolist()
-        
-    def get_places_for_dhlabids(self, dhlabids, max_places=200):
-        """Get place data for a set of dhlabids"""
-        if dhlabids is None or (isinstance(dhlabids, np.ndarray) and dhlabids.size == 0) or len(dhlabids) == 0:
-            return pd.DataFrame()
-            
-        if isinstance(dhlabids, np.ndarray):
-            dhlabids = dhlabids.tolist()
-            
-        base_query = """
-        SELECT
-            dhlabid,
-            token,
-            name as modern_name,
-            freq,
-            lat,
-            lon,
-            feature_class
-        FROM places
-        WHERE dhlabid IN ({})
-        """
-        
-        return self._execute_batched_query(
-            base_query=base_query,
-            id_list=dhlabids,
-            db_path=self.places_db
-        )
+    @staticmethod
+    def _id_key(dhlabids):
+        """Order-independent, hashable key for a collection of dhlabids"""
+        return tuple(sorted({int(x) for x in dhlabids}))
     
     def get_metadata_for_dhlabids(self, dhlabids):
         """Get corpus metadata for a set of documents"""
-        if dhlabids is None or (isinstance(dhlabids, np.ndarray) and dhlabids.size == 0) or len(dhlabids) == 0:
+        if dhlabids is None or len(dhlabids) == 0:
             return pd.DataFrame()
-            
-        if isinstance(dhlabids, np.ndarray):
-            dhlabids = dhlabids.tolist()
-            
+        
+        return self._metadata_for_ids(self._id_key(dhlabids)).copy()
+    
+    @functools.lru_cache(maxsize=32)
+    def _metadata_for_ids(self, id_key):
         base_query = """
         SELECT dhlabid, title, author, year, urn
         FROM metadata
         WHERE dhlabid IN ({})
         """
         
-        return self._execute_batched_query(
+        rows = self._query_for_ids(
             base_query=base_query,
-            id_list=dhlabids,
+            id_list=id_key,
             db_path=self.corpus_db
         )
-
+        return pd.DataFrame.from_records(
+            rows,
+            columns=['dhlabid', 'title', 'author', 'year', 'urn']
+        ).astype({'dhlabid': 'int32', 'year': 'int16'})
 
 BASEMAP_OPTIONS = [
     "OpenStreetMap.Mapnik",
@@ -279,6 +341,11 @@ WORLD_VIEW = {
     'zoom': 2
 }
 
+# Maximum number of place names returned per dropdown search
+PLACE_SEARCH_LIMIT = 100
+# Above this many places the cumulative timeline is drawn server-side as a single image overlay
+TIMELINE_RASTER_THRESHOLD = 1500
+
 EUROPE_VIEW = {
     'center': [55, 15],
     'zoom': 4
@@ -311,15 +378,39 @@ color_emojis = {
     'V': '🟩'   # Dark Green for Skog og mark
 }
 
+# Timeline legend pieces; a frame only picks the rows for the classes it shows
+LEGEND_HEADER = """
+            <div style="position: fixed; 
+                        bottom: 50px; right: 50px; 
+                        border:2px solid grey; z-index:9999; font-size:14px;
+                        background-color:white;
+                        padding: 10px;
+                        opacity: 0.8;">
+            """
+LEGEND_ROWS = {
+    feature_class: f"""
+                <div>
+                    <i class="fa fa-circle fa-1x" style="color:{feature_colors[feature_class]}"></i>
+                    {description}
+                </div>"""
+    for feature_class, description in feature_descriptions.items()
+}
+LEGEND_FOOTER = "</div>"
+
+# Shown by the timeline graph before there is a selection
+EMPTY_FIGURE = go.Figure(layout=go.Layout(title='No data'))
+
 
 
 
-def create_popup_html(place, place_books):
+@functools.lru_cache(maxsize=20000)
+def create_popup_html(token, modern_name, freq, urn=None, title=None, author=None, year=None):
+    # Takes plain values so repeated renders of the same place and book hit the cache
     html = f"""
     <div style='width:500px'>
-        <h4>{place['token']}</h4>
-        <p><strong>Moderne navn:</strong> {place['modern_name']}</p>
-        <p><strong>{place['freq']} forekomster</strong></p>
+        <h4>{token}</h4>
+        <p><strong>Moderne navn:</strong> {modern_name}</p>
+        <p><strong>{freq} forekomster</strong></p>
         <div style='max-height: 400px; overflow-y: auto;'>
             <table style='width: 100%; border-collapse: collapse;'>
                 <thead style='position: sticky; top: 0; background: white;'>
@@ -332,17 +423,16 @@ def create_popup_html(place, place_books):
                 <tbody>
     """
     
-    # Now place_books should just be the single matching book
-    book = place_books.iloc[0] if not place_books.empty else None
-    if book is not None:
-        book_url = f"https://nb.no/items/{book.urn}?searchText=\"{quote(place['token'])}\""
+    # The book is the single document this place mention comes from
+    if urn is not None:
+        book_url = f"https://nb.no/items/{urn}?searchText=\"{quote(token)}\""
         html += f"""
             <tr>
                 <td style='border: 1px solid #ddd; padding: 8px;'>
-                    <a href='{book_url}' target='_blank'>{book.title}</a>
+                    <a href='{book_url}' target='_blank'>{title}</a>
                 </td>
-                <td style='border: 1px solid #ddd; padding: 8px;'>{book.author}</td>
-                <td style='border: 1px solid #ddd; padding: 8px;'>{book.year}</td>
+                <td style='border: 1px solid #ddd; padding: 8px;'>{author}</td>
+                <td style='border: 1px solid #ddd; padding: 8px;'>{year}</td>
             </tr>
         """
     
@@ -354,29 +444,58 @@ def create_popup_html(place, place_books):
     """
     return html
 
+# Builds the same popup as create_popup_html in the browser, only when a marker is opened
+MARKER_POPUP_JS = folium.JsCode("""
+function(feature, layer) {
+    var p = feature.properties;
+    layer.bindTooltip(p.token + ': ' + p.freq + ' forekomster');
+    layer.bindPopup(function() {
+        var cell = "<td style='border: 1px solid #ddd; padding: 8px;'>";
+        var header = "<th style='border: 1px solid #ddd; padding: 8px; text-align: left;'>";
+        var row = '';
+        if (p.urn) {
+            var url = 'https://nb.no/items/' + p.urn + '?searchText="' + encodeURIComponent(p.token) + '"';
+            row = '<tr>' + cell + "<a href='" + url + "' target='_blank'>" + p.title + '</a></td>'
+                + cell + p.author + '</td>' + cell + p.year + '</td></tr>';
+        }
+        return "<div style='width:500px'>"
+            + '<h4>' + p.token + '</h4>'
+            + '<p><strong>Moderne navn:</strong> ' + p.modern_name + '</p>'
+            + '<p><strong>' + p.freq + ' forekomster</strong></p>'
+            + "<div style='max-height: 400px; overflow-y: auto;'>"
+            + "<table style='width: 100%; border-collapse: collapse;'>"
+            + "<thead style='position: sticky; top: 0; background: white;'><tr>"
+            + header + 'Title</th>' + header + 'Author</th>' + header + 'Year</th>'
+            + '</tr></thead><tbody>' + row + '</tbody></table></div></div>';
+    }, {maxWidth: 500});
+}
+""")
+
+def marker_radii(freq, marker_size, max_radius=60):
+    # Plain array in, array out: one vectorized log instead of one per marker
+    return np.minimum(6 + np.log(freq) * marker_size, max_radius)
+
 def make_map(significant_places, corpus_df, basemap, marker_size, center=None, zoom=None):
-    cache_key = f"{significant_places.shape[0]}_{basemap}_{marker_size}_{center}_{zoom}"
-    
-    def create_map():
-        significant_places_clean = significant_places.dropna(subset=['lat', 'lon'])
-        center_lat = significant_places_clean['lat'].median() if center is None else center[0]
-        center_lon = significant_places_clean['lon'].median() if center is None else center[1]
-        current_zoom = EUROPE_VIEW['zoom'] if zoom is None else zoom
-    
-        m = leafmap.Map(center=[center_lat, center_lon], zoom=current_zoom, basemap=basemap)
-    
-        # Create cluster groups for each feature class
-        cluster_groups = {}
-        for feature_class, description in feature_descriptions.items():
-            cluster_groups[feature_class] = MarkerCluster(
-                name=f"{description} {color_emojis.get(feature_class, '🔲')}",
-                options={
-                    'spiderfyOnMaxZoom': True,
-                    'showCoverageOnHover': True,
-                    'zoomToBoundsOnClick': True,
-                    'maxClusterRadius': 40,
-                },
-                icon_create_function=f"""
+    # Callers cache the returned HTML under their own key
+    significant_places_clean = significant_places.dropna(subset=['lat', 'lon'])
+    center_lat = significant_places_clean['lat'].median() if center is None else center[0]
+    center_lon = significant_places_clean['lon'].median() if center is None else center[1]
+    current_zoom = EUROPE_VIEW['zoom'] if zoom is None else zoom
+
+    m = leafmap.Map(center=[center_lat, center_lon], zoom=current_zoom, basemap=basemap)
+
+    # Create cluster groups for each feature class
+    cluster_groups = {}
+    for feature_class, description in feature_descriptions.items():
+        cluster_groups[feature_class] = MarkerCluster(
+            name=f"{description} {color_emojis.get(feature_class, '🔲')}",
+            options={
+                'spiderfyOnMaxZoom': True,
+                'showCoverageOnHover': True,
+                'zoomToBoundsOnClick': True,
+                'maxClusterRadius': 40,
+            },
+            icon_create_function=f"""
 function(cluster) {{
     var childCount = cluster.getChildCount();
     var size = Math.min(40 + Math.log(childCount) * 10, 80);
@@ -387,46 +506,52 @@ function(cluster) {{
     }});
 }}
 """
-            ).add_to(m)
+        ).add_to(m)
 
-        # Process places in batches
-        batch_size = 50
-        for i in range(0, len(significant_places), batch_size):
-            batch = significant_places.iloc[i:i+batch_size]
-            
-            for _, place in batch.iterrows():
-                # Get the book info for this specific place mention
-                place_books = corpus_df[corpus_df.dhlabid == place['dhlabid']]
-                
-                popup_html = create_popup_html(place, place_books)
-                
-                radius = min(6 + np.log(place['freq']) * marker_size, 60)
-                marker = folium.CircleMarker(
-                    radius=radius,
-                    location=[place['lat'], place['lon']],
-                    popup=folium.Popup(popup_html, max_width=500),
-                    tooltip=f"{place['token']}: {place['freq']} forekomster",
-                    color=feature_colors[place['feature_class']],
-                    fill=True,
-                    fill_color=feature_colors[place['feature_class']],
-                    fill_opacity=0.7,
-                    weight=1,
-                    frequency=float(place['freq'])
-                )
-                marker.add_to(cluster_groups[place['feature_class']])
+    # Index the books once instead of scanning corpus_df for every place
+    books_by_id = {book.dhlabid: book for book in corpus_df.itertuples(index=False)}
+    
+    radii = marker_radii(significant_places['freq'].to_numpy(), marker_size)
+    
+    # Markers carry only the fields their popup needs; MARKER_POPUP_JS renders it on click
+    features = {feature_class: [] for feature_class in cluster_groups}
+    for place, radius in zip(significant_places.itertuples(index=False), radii):
+        book = books_by_id.get(place.dhlabid)
+        features[place.feature_class].append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [float(place.lon), float(place.lat)]},
+            'properties': {
+                'style': {'radius': float(radius)},
+                'token': place.token,
+                'modern_name': place.modern_name,
+                'freq': int(place.freq),
+                'urn': book.urn if book is not None else None,
+                'title': book.title if book is not None else None,
+                'author': book.author if book is not None else None,
+                'year': int(book.year) if book is not None else None,
+            }
+        })
+    
+    # One GeoJSON layer per class; the cluster group takes over its circle markers
+    for feature_class, class_features in features.items():
+        if not class_features:
+            continue
+        color = feature_colors[feature_class]
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': class_features},
+            marker=folium.CircleMarker(color=color, fill=True, fill_color=color, fill_opacity=0.7, weight=1),
+            on_each_feature=MARKER_POPUP_JS,
+            control=False
+        ).add_to(cluster_groups[feature_class])
 
-        folium.LayerControl(collapsed=False, position='topright').add_to(m)
-        return folium_to_html(m)
+    folium.LayerControl(collapsed=False, position='topright').add_to(m)
+    return folium_to_html(m)
 
-    return get_cached_map_html(cache_key, create_map)
 
 def create_heatmap(places_df, intensity=3, radius=15, blur=10, basemap="OpenStreetMap.Mapnik"):
     """Create a heatmap from places data"""
     if places_df.empty:
         return ""
-        
-    # Calculate weight based on frequency and intensity
-    places_df['weight'] = places_df['freq'] * intensity
     
     # Create base map centered on data
     center_lat = places_df['lat'].median()
@@ -436,8 +561,14 @@ def create_heatmap(places_df, intensity=3, radius=15, blur=10, basemap="OpenStre
                    zoom_start=4,
                    tiles=basemap)
     
-    # Prepare data for heatmap
-    heat_data = places_df[['lat', 'lon', 'weight']].values.tolist()
+    # The same place repeats once per book; Leaflet.heat sums intensities at a point,
+    # so sum them here and send each coordinate once
+    weights = places_df.groupby(['lat', 'lon'], sort=False)['freq'].sum()
+    heat_data = np.column_stack([
+        weights.index.get_level_values('lat'),
+        weights.index.get_level_values('lon'),
+        weights.to_numpy() * intensity
+    ]).tolist()
     
     # Add heatmap layer
     HeatMap(heat_data,
@@ -448,23 +579,95 @@ def create_heatmap(places_df, intensity=3, radius=15, blur=10, basemap="OpenStre
     
     return folium_to_html(m)
 
-# Cache for map HTML
-_map_cache = {}
+def mercator_y(lat):
+    lat = np.radians(np.clip(lat, -85, 85))
+    return np.log(np.tan(np.pi / 4 + lat / 2))
+
+def smooth_grid(grid, sigma):
+    """Separable Gaussian blur of a 2D grid"""
+    offsets = np.arange(-int(3 * sigma), int(3 * sigma) + 1)
+    kernel = np.exp(-offsets ** 2 / (2 * sigma ** 2))
+    kernel /= kernel.sum()
+    grid = np.apply_along_axis(np.convolve, 0, grid, kernel, mode='same')
+    return np.apply_along_axis(np.convolve, 1, grid, kernel, mode='same')
+
+def rasterize_places(lat, lon, freq, feature_class, width=1024, sigma=1.5, min_opacity=0.3):
+    """Render places to an RGBA image coloured by the dominant feature class, with lat/lon bounds for ImageOverlay"""
+    # Bin in web mercator space, since Leaflet stretches overlays linearly in projected coordinates
+    x = np.radians(lon)
+    y = mercator_y(lat)
+    x_min, x_max = x.min(), x.max()
+    y_min, y_max = y.min(), y.max()
+    pad = 0.05 * max(x_max - x_min, y_max - y_min, 0.01)
+    x_min, x_max, y_min, y_max = x_min - pad, x_max + pad, y_min - pad, y_max + pad
+    height = max(1, int(width * (y_max - y_min) / (x_max - x_min)))
+    
+    # One mention grid per feature class, in feature_colors order
+    classes = list(feature_colors)
+    grids = np.stack([
+        smooth_grid(np.histogram2d(y[feature_class == fc], x[feature_class == fc], bins=(height, width),
+                                   range=[[y_min, y_max], [x_min, x_max]], weights=freq[feature_class == fc])[0], sigma)
+        for fc in classes
+    ])
+    total = grids.sum(axis=0)
+    density = np.log1p(total) / np.log1p(total.max()) if total.max() > 0 else total
+    
+    palette = branca.colormap.LinearColormap([feature_colors[fc] for fc in classes], index=list(range(len(classes)))).colors
+    image = (np.array(palette)[grids.argmax(axis=0)] * 255).astype(np.uint8)
+    image[..., 3] = np.where(density > 0.01, (min_opacity + (1 - min_opacity) * density) * 255, 0).astype(np.uint8)
+    
+    lat_bounds = np.degrees(2 * np.arctan(np.exp([y_min, y_max])) - np.pi / 2)
+    lon_bounds = np.degrees([x_min, x_max])
+    bounds = [[lat_bounds[0], lon_bounds[0]], [lat_bounds[1], lon_bounds[1]]]
+    # Row 0 of the histogram is the southern edge; images are drawn from the top
+    return image[::-1], bounds
 
-def get_cached_map_html(cache_key, create_map_func):
-    """Cache map HTML to avoid regeneration"""
-    global _map_cache
-    if cache_key not in _map_cache:
-        _map_cache[cache_key] = create_map_func()
-    return _map_cache[cache_key]
+# Cache for map HTML; rendered maps are large, so only keep the most recent ones
+_map_cache = OrderedDict()
+MAP_CACHE_SIZE = 16
+# Timeline frames get their own cache so scrubbing through the years can't push out the
+# map and heatmap pages; slice frames run to several MB each, so it is also bounded by size
+_timeline_cache = OrderedDict()
+TIMELINE_CACHE_SIZE = 64
+TIMELINE_CACHE_CHARS = 128 * 1024 * 1024
+# The map callbacks run on parallel threads; the lock covers lookups and evictions, not rendering
+_map_cache_lock = threading.Lock()
+
+def get_cached_map_html(cache_key, create_map_func, cache=_map_cache, max_entries=MAP_CACHE_SIZE, max_chars=None):
+    """Cache map HTML to avoid regeneration; max_chars also bounds the total length of the cached pages"""
+    with _map_cache_lock:
+        if cache_key in cache:
+            cache.move_to_end(cache_key)
+            return cache[cache_key]
+    html_str = create_map_func()
+    with _map_cache_lock:
+        cache[cache_key] = html_str
+        cache.move_to_end(cache_key)
+        # The newest page is always kept, even when it alone exceeds max_chars
+        while len(cache) > 1 and (len(cache) > max_entries or
+                                  (max_chars is not None and sum(map(len, cache.values())) > max_chars)):
+            cache.popitem(last=False)
+    return html_str
 
 def folium_to_html(m):
     """Convert Folium map to HTML string"""
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.html') as tmp:
-        m.save(tmp.name)
-        with open(tmp.name, 'r', encoding='utf-8') as f:
-            html_str = f.read()
-    return html_str
+    return m.get_root().render()
+
+def df_to_store(df):
+    """Serialize a DataFrame for a dcc.Store as base64 Arrow IPC; keeps dtypes and is far smaller than JSON"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression='zstd')) as writer:
+        writer.write_table(table)
+    return base64.b64encode(sink.getvalue()).decode('ascii')
+
+def store_to_df(data):
+    """Read a DataFrame back from df_to_store output"""
+    return pa.ipc.open_stream(base64.b64decode(data)).read_pandas()
+
+def store_digest(data):
+    """Short stable key for a store payload, for use in map cache keys"""
+    return hashlib.sha1(data.encode('ascii')).hexdigest()
 
 def create_layout(dl):
     """Create the complete Dash app layout with improved organization"""
@@ -480,6 +683,8 @@ def create_layout(dl):
             ], style={'padding': '20px', 'backgroundColor': 'white', 'marginBottom': '20px'}),
             
             # Core Filters Panel
+            # Sliders only report on mouse release; the multi-selects hold their picks until the
+            # menu closes, so choosing several values triggers one update_filtered_data call
             html.Div([
                 html.H3("Filters", style={'marginBottom': '15px'}),
                 
@@ -496,28 +701,37 @@ def create_layout(dl):
                 dcc.Dropdown(
                     id='category-dropdown',
                     options=[{'label': c, 'value': c} for c in dl.get_unique_values('category')],
-                    multi=True
+                    multi=True,
+                    debounce=True,
+                    closeOnSelect=False
                 ),
                 
                 html.Label("Author", style={'marginTop': '15px'}),
                 dcc.Dropdown(
                     id='author-dropdown',
                     options=[{'label': a, 'value': a} for a in dl.get_unique_values('author')],
-                    multi=True
+                    multi=True,
+                    debounce=True,
+                    closeOnSelect=False
                 ),
                 
                 html.Label("Title", style={'marginTop': '15px'}),
                 dcc.Dropdown(
                     id='title-dropdown',
                     options=[{'label': t, 'value': t} for t in dl.get_unique_values('title')],
-                    multi=True
+                    multi=True,
+                    debounce=True,
+                    closeOnSelect=False
                 ),
                 
                 html.Label("Places", style={'marginTop': '15px'}),
                 dcc.Dropdown(
                     id='places-dropdown',
-                    options=[],  # Dynamically populated
-                    multi=True
+                    options=[],  # Populated from the search text, see update_place_options
+                    placeholder="Type to search places...",
+                    multi=True,
+                    debounce=True,
+                    closeOnSelect=False
                 ),
             ], style={'padding': '20px', 'backgroundColor': 'white', 'marginBottom': '20px'}),
             
@@ -814,7 +1028,10 @@ def create_layout(dl):
         
         # Stores for state management
         dcc.Store(id='filtered-data'),
-        dcc.Store(id='filtered-agg-data')
+        dcc.Store(id='filtered-agg-data'),
+        dcc.Store(id='filtered-map-data'),
+        dcc.Store(id='timeline-merged'),
+        dcc.Store(id='timeline-years')
     ])
 
 
@@ -836,9 +1053,29 @@ def register_callbacks(app, dl):
             html.P(f"Years: {stats['year_range']['min_year']} - {stats['year_range']['max_year']}")
         ])
     
+    @app.callback(
+        Output('places-dropdown', 'options'),
+        Input('places-dropdown', 'search_value'),
+        State('places-dropdown', 'value')
+    )
+    def update_place_options(search_value, selected):
+        """Only send place names matching the typed text instead of the full list"""
+        if not search_value:
+            raise PreventUpdate
+        
+        query = search_value.lower()
+        matches = [t for t in dl.get_unique_places() if query in t.lower()][:PLACE_SEARCH_LIMIT]
+        
+        # Selected values must stay in the options or the dropdown drops them
+        selected = selected or []
+        return [{'label': t, 'value': t} for t in selected + [t for t in matches if t not in selected]]
+    
     @app.callback(
         [Output('filtered-data', 'data'),
          Output('filtered-agg-data', 'data'),
+         Output('filtered-map-data', 'data'),
+         Output('timeline-merged', 'data'),
+         Output('timeline-years', 'data'),
          Output('selection-stats-panel', 'children')],  # Updated ID
         [Input('year-slider', 'value'),
          Input('category-dropdown', 'value'),
@@ -848,42 +1085,30 @@ def register_callbacks(app, dl):
          Input('sample-size-slider', 'value')]
     )
     def update_filtered_data(years, categories, authors, titles, places, sample_size):
-        # Get filtered document IDs with sampling
-        filtered_ids = dl.get_filtered_corpus_ids(
+        # Filter, sample and fetch places in one query; the place filter is joined in SQL
+        filtered_ids, raw_places = dl.get_filtered_places(
             years=years,
             categories=categories,
             authors=authors,
             titles=titles,
-            sample_size=sample_size
+            sample_size=sample_size,
+            place_tokens=places
         )
         
         if not filtered_ids:
-            return None, None, html.Div([
+            return None, None, None, None, None, html.Div([
                 html.H3("Current Selection"),
-                html.P("No documents match the criteria")
+                html.P("No documents match the place filters" if places else "No documents match the criteria")
             ])
         
-        # Apply place filters if selected
-        if places:
-            filtered_ids = dl.filter_by_places(filtered_ids, places)
-            
-        if not filtered_ids:
-            return None, None, html.Div([
-                html.H3("Current Selection"),
-                html.P("No documents match the place filters")
-            ])
-        
-        # Get places data
-        raw_places = dl.get_places_for_dhlabids(filtered_ids)
-        
         if raw_places.empty:
-            return None, None, html.Div([
+            return None, None, None, None, None, html.Div([
                 html.H3("Current Selection"),
                 html.P("No place data found for selected documents")
             ])
         
-        # Aggregate the data
-        aggregated = (raw_places.groupby(['token', 'modern_name', 'feature_class'])
+        # Aggregate the data; sorted by mentions below, so the groupby needn't sort
+        aggregated = (raw_places.groupby(['token', 'modern_name', 'feature_class'], sort=False, observed=True)
                      .agg({
                          'freq': 'sum',
                          'dhlabid': 'nunique'
@@ -897,6 +1122,11 @@ def register_callbacks(app, dl):
         # Sort by total mentions
         aggregated = aggregated.sort_values('total_mentions', ascending=False)
         
+        # Per-coordinate counts for the map, so marker and basemap changes only take the top places
+        place_counts = (raw_places.groupby(['token', 'modern_name', 'lat', 'lon', 'feature_class'], sort=False, observed=True)
+                       .agg({'freq': 'sum', 'dhlabid': 'first'})
+                       .reset_index())
+        
         # Create selection stats
         stats = html.Div([
             html.H3("Current Selection"),
@@ -905,48 +1135,52 @@ def register_callbacks(app, dl):
             html.P(f"Total mentions: {aggregated['total_mentions'].sum():,}")
         ])
         
-        return (raw_places.to_json(date_format='iso', orient='split'),
-                aggregated.to_json(date_format='iso', orient='split'),
+        # Each store carries only the columns its callbacks read: the heatmap needs coordinates
+        # and counts, the timeline callbacks the full place rows with their book year
+        return (df_to_store(raw_places[['lat', 'lon', 'freq']]),
+                df_to_store(aggregated),
+                df_to_store(place_counts),
+                df_to_store(raw_places),
+                {'min_year': int(raw_places['year'].min()), 'max_year': int(raw_places['year'].max())},
                 stats)
         
     @app.callback(
         Output('map-iframe', 'srcDoc'),
-        [Input('filtered-data', 'data'),
+        [Input('filtered-map-data', 'data'),
          Input('basemap-dropdown', 'value'),
          Input('marker-size-slider', 'value'),
          Input('max-places-slider', 'value')]  # Add this input
     )
-    def update_map(raw_json, basemap, marker_size, max_places):
-        if not raw_json:
+    def update_map(place_counts_data, basemap, marker_size, max_places):
+        if not place_counts_data:
             return ""
         
-        # Deserialize JSON into a DataFrame
-        raw_places = pd.read_json(raw_json, orient='split')
+        # Repeated inputs skip decoding as well as the rendering
+        cache_key = ('map', store_digest(place_counts_data), basemap, marker_size, max_places)
         
-        # Aggregate and limit before mapping
-        place_counts = (raw_places.groupby(['token', 'modern_name', 'lat', 'lon', 'feature_class'])
-                       .agg({'freq': 'sum', 'dhlabid': 'first'})
-                       .reset_index()
-                       .nlargest(max_places, 'freq'))
-        
-        # Get metadata for these documents
-        all_dhlabids = place_counts['dhlabid'].unique()
-        corpus_df = dl.get_metadata_for_dhlabids(all_dhlabids)
+        def create_map():
+            # Counts are aggregated once in update_filtered_data; only limit here
+            place_counts = store_to_df(place_counts_data).nlargest(max_places, 'freq')
+            
+            # Get metadata for these documents
+            all_dhlabids = place_counts['dhlabid'].unique()
+            corpus_df = dl.get_metadata_for_dhlabids(all_dhlabids)
+            
+            # Generate the map
+            return make_map(place_counts, corpus_df, basemap, marker_size)
         
-        # Generate the map
-        return make_map(place_counts, corpus_df, basemap, marker_size)
+        return get_cached_map_html(cache_key, create_map)
     
     @app.callback(
         Output('place-summary', 'children'),
         [Input('filtered-agg-data', 'data')]
     )
-    def update_place_summary(aggregated_json):
+    def update_place_summary(aggregated_data):
         """Update place summary based on pre-aggregated data"""
-        if not aggregated_json:
+        if not aggregated_data:
             return "No places to display"
         
-        # Deserialize JSON into a DataFrame
-        aggregated = pd.read_json(aggregated_json, orient='split')
+        aggregated = store_to_df(aggregated_data)
         
         # Sort and get the top 10 places by mentions
         top_places = aggregated.nlargest(10, 'total_mentions')
@@ -957,10 +1191,10 @@ def register_callbacks(app, dl):
             [html.Tr([html.Th("Place"), html.Th("Mentions"), html.Th("Documents")])] +
             # Rows
             [html.Tr([
-                html.Td(row['token']),
-                html.Td(f"{row['total_mentions']:,}"),
-                html.Td(row['doc_count'])
-            ]) for _, row in top_places.iterrows()]
+                html.Td(token),
+                html.Td(f"{mentions:,}"),
+                html.Td(docs)
+            ]) for token, mentions, docs in top_places[['token', 'total_mentions', 'doc_count']].itertuples(index=False, name=None)]
         )
         
         return html.Div([
@@ -979,41 +1213,14 @@ def register_heatmap_callbacks(app, dl):
          Input('heatmap-blur-slider', 'value'),
          Input('basemap-dropdown', 'value')]
     )
-    def update_heatmap(places_json, intensity, radius, blur, basemap):
-        if not places_json:
+    def update_heatmap(places_data, intensity, radius, blur, basemap):
+        if not places_data:
             return ""
             
-        # Convert JSON to DataFrame
-        places_df = pd.read_json(places_json, orient='split')
-        
-        # Create base map centered on data
-        center_lat = places_df['lat'].median()
-        center_lon = places_df['lon'].median()
-        
-        m = folium.Map(location=[center_lat, center_lon],
-                      zoom_start=4,
-                      tiles=basemap)
-        
-        # Calculate weight based on frequency and intensity
-        places_df['weight'] = places_df['freq'] * intensity
-        
-        # Prepare data for heatmap
-        heat_data = places_df[['lat', 'lon', 'weight']].values.tolist()
-        
-        # Add heatmap layer
-        HeatMap(heat_data,
-               radius=radius,
-               blur=blur,
-               max_zoom=1,
-               gradient={0.4: 'blue', 0.65: 'lime', 1: 'red'}).add_to(m)
-        
-        # Convert to HTML
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.html') as tmp:
-            m.save(tmp.name)
-            with open(tmp.name, 'r', encoding='utf-8') as f:
-                html_str = f.read()
-                
-        return html_str
+        cache_key = ('heatmap', store_digest(places_data), intensity, radius, blur, basemap)
+        return get_cached_map_html(
+            cache_key, lambda: create_heatmap(store_to_df(places_data), intensity, radius, blur, basemap)
+        )
 
 
 def register_timeline_callbacks(app, dl):
@@ -1053,149 +1260,151 @@ def register_timeline_callbacks(app, dl):
         return new_year, f"Year: {new_year}", play_state    
     @app.callback(
         Output('timeline-map-iframe', 'srcDoc'),
-        [Input('filtered-data', 'data'),
+        [Input('timeline-merged', 'data'),
          Input('timeline-type', 'value'),
          Input('year-timeline-slider', 'value'),
          Input('place-persistence', 'value'),
-         Input('timeline-basemap', 'value')]
+         Input('timeline-basemap', 'value')],
+        State('timeline-years', 'data')
     )
-    def update_timeline_map(places_json, viz_type, current_year, persistence, basemap):
+    def update_timeline_map(merged_data, viz_type, current_year, persistence, basemap, year_range):
         print("Timeline map callback triggered")  # Debug print
-        if not places_json:
+        if not merged_data:
             return ""
+        
+        # Years outside the selection need no decoding: earlier ones are empty, and in
+        # cumulative mode later ones show the same places as the last year
+        if year_range:
+            if viz_type == 'cumulative':
+                if current_year < year_range['min_year']:
+                    return ""
+                current_year = min(current_year, year_range['max_year'])
+            elif current_year < year_range['min_year'] or current_year - persistence + 1 > year_range['max_year']:
+                return ""
             
-        # Convert JSON to DataFrame
-        places_df = pd.read_json(places_json, orient='split')
+        # Scrubbing back and forth revisits the same years; reuse their rendered maps
+        cache_key = ('timeline', store_digest(merged_data), viz_type, current_year, persistence, basemap)
         
-        # Get metadata for the places
-        all_dhlabids = places_df['dhlabid'].unique()
-        corpus_df = dl.get_metadata_for_dhlabids(all_dhlabids)
+        def create_map():
+            # Places with their book year, joined once in update_filtered_data
+            merged_df = store_to_df(merged_data)
         
-        # Merge place data with year information
-        merged_df = places_df.merge(corpus_df[['dhlabid', 'year']], on='dhlabid')
+            # Filter based on visualization type
+            if viz_type == 'cumulative':
+                # Show all places up to current year
+                filtered_df = merged_df[merged_df['year'] <= current_year]
+            else:  # time slice
+                # Show places within persistence window
+                year_start = current_year - persistence + 1
+                filtered_df = merged_df[
+                    (merged_df['year'] >= year_start) & 
+                    (merged_df['year'] <= current_year)
+                ]
         
-        # Filter based on visualization type
-        if viz_type == 'cumulative':
-            # Show all places up to current year
-            filtered_df = merged_df[merged_df['year'] <= current_year]
-        else:  # time slice
-            # Show places within persistence window
-            year_start = current_year - persistence + 1
-            filtered_df = merged_df[
-                (merged_df['year'] >= year_start) & 
-                (merged_df['year'] <= current_year)
-            ]
+            if filtered_df.empty:
+                return ""
         
-        if filtered_df.empty:
-            return ""
+            # Create the map
+            center_lat = filtered_df['lat'].median()
+            center_lon = filtered_df['lon'].median()
         
-        # Create the map
-        center_lat = filtered_df['lat'].median()
-        center_lon = filtered_df['lon'].median()
+            m = folium.Map(
+                location=[center_lat, center_lon],
+                zoom_start=4,
+                tiles=basemap or "OpenStreetMap.Mapnik"
+            )
         
-        m = folium.Map(
-            location=[center_lat, center_lon],
-            zoom_start=4,
-            tiles=basemap or "OpenStreetMap.Mapnik"
-        )
+            if viz_type == 'cumulative' and len(filtered_df) > TIMELINE_RASTER_THRESHOLD:
+                # Too many markers for the browser: draw the places here as one image
+                image, bounds = rasterize_places(
+                    filtered_df['lat'].to_numpy(),
+                    filtered_df['lon'].to_numpy(),
+                    filtered_df['freq'].to_numpy(dtype=np.float64),
+                    filtered_df['feature_class'].to_numpy()
+                )
+                folium.raster_layers.ImageOverlay(image=image, bounds=bounds, pixelated=False).add_to(m)
+            else:
+                # Metadata is only needed for the popups of the places shown this year
+                corpus_df = dl.get_metadata_for_dhlabids(filtered_df['dhlabid'].unique())
         
-        # Add the markers - no clustering
-        for _, place in filtered_df.iterrows():
-            # Calculate opacity based on recency
-            years_old = current_year - place['year']
-            opacity = 1.0 if viz_type == 'cumulative' else max(0.3, 1 - (years_old / persistence))
-            
-            # Calculate radius based on frequency
-            radius = min(6 + np.log(place['freq']) * 3, 30)
-            
-            # Create popup
-            place_books = corpus_df[corpus_df.dhlabid == place['dhlabid']]
-            popup_html = create_popup_html(place, place_books)
+                # Marker styling for all places at once
+                freqs = filtered_df['freq'].to_numpy()
+                radii = np.minimum(6 + np.log(freqs) * 3, 30)
+                if viz_type == 'cumulative':
+                    opacities = np.ones(len(filtered_df))
+                else:
+                    # Fade with age inside the persistence window
+                    years_old = current_year - filtered_df['year'].to_numpy()
+                    opacities = np.maximum(0.3, 1 - (years_old / persistence))
+                colors = filtered_df['feature_class'].map(feature_colors).to_numpy()
+        
+                # Add the markers - no clustering
+                books_by_id = {book.dhlabid: book for book in corpus_df.itertuples(index=False)}
+                for place, radius, opacity, color in zip(filtered_df.itertuples(index=False), radii, opacities, colors):
+                    # Create popup
+                    book = books_by_id.get(place.dhlabid)
+                    if book is not None:
+                        popup_html = create_popup_html(place.token, place.modern_name, place.freq,
+                                                       book.urn, book.title, book.author, book.year)
+                    else:
+                        popup_html = create_popup_html(place.token, place.modern_name, place.freq)
             
-            # Add marker
-            folium.CircleMarker(
-                location=[place['lat'], place['lon']],
-                radius=radius,
-                popup=folium.Popup(popup_html, max_width=500),
-                tooltip=f"{place['token']} ({place['year']}): {place['freq']} mentions",
-                color=feature_colors[place['feature_class']],
-                fill=True,
-                fill_color=feature_colors[place['feature_class']],
-                fill_opacity=opacity,
-                weight=2
-            ).add_to(m)
+                    # Add marker
+                    folium.CircleMarker(
+                        location=[place.lat, place.lon],
+                        radius=radius,
+                        popup=folium.Popup(popup_html, max_width=500),
+                        tooltip=f"{place.token} ({place.year}): {place.freq} mentions",
+                        color=color,
+                        fill=True,
+                        fill_color=color,
+                        fill_opacity=opacity,
+                        weight=2
+                    ).add_to(m)
         
-        # Add legend
-        feature_legend = {}
-        for _, place in filtered_df.iterrows():
-            feature_class = place['feature_class']
-            if feature_class not in feature_legend:
-                feature_legend[feature_class] = feature_descriptions[feature_class]
+            # Add legend; unique() keeps the classes in order of first appearance
+            legend_classes = filtered_df['feature_class'].unique()
+            if len(legend_classes):
+                legend_html = "".join([LEGEND_HEADER, *(LEGEND_ROWS[fc] for fc in legend_classes), LEGEND_FOOTER])
+                m.get_root().html.add_child(folium.Element(legend_html))
         
-        if feature_legend:
-            legend_html = """
-            <div style="position: fixed; 
-                        bottom: 50px; right: 50px; 
-                        border:2px solid grey; z-index:9999; font-size:14px;
-                        background-color:white;
-                        padding: 10px;
-                        opacity: 0.8;">
-            """
-            
-            for feature_class, description in feature_legend.items():
-                color = feature_colors[feature_class]
-                legend_html += f"""
-                <div>
-                    <i class="fa fa-circle fa-1x" style="color:{color}"></i>
-                    {description}
-                </div>"""
-            
-            legend_html += "</div>"
-            m.get_root().html.add_child(folium.Element(legend_html))
+            return folium_to_html(m)
         
-        # Convert to HTML
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.html') as tmp:
-            m.save(tmp.name)
-            with open(tmp.name, 'r', encoding='utf-8') as f:
-                html_str = f.read()
-                
-        return html_str
+        return get_cached_map_html(cache_key, create_map, cache=_timeline_cache,
+                                   max_entries=TIMELINE_CACHE_SIZE, max_chars=TIMELINE_CACHE_CHARS)
     @app.callback(
         Output('timeline-graph', 'figure'),
-        [Input('filtered-data', 'data'),
+        [Input('timeline-merged', 'data'),
          Input('year-timeline-slider', 'value'),
-         Input('timeline-type', 'value')]
+         Input('timeline-type', 'value')],
+        State('timeline-years', 'data')
     )
-    def update_timeline_graph(places_json, current_year, viz_type):
-        if not places_json:
-            return {}
-        
-        # Convert JSON to DataFrame
-        places_df = pd.read_json(places_json, orient='split')
-        
-        # Get metadata for the places
-        all_dhlabids = places_df['dhlabid'].unique()
-        corpus_df = dl.get_metadata_for_dhlabids(all_dhlabids)
+    def update_timeline_graph(merged_data, current_year, viz_type, year_range):
+        if not merged_data:
+            return EMPTY_FIGURE
         
-        # Merge place data with year information
-        merged_df = places_df.merge(corpus_df[['dhlabid', 'year']], on='dhlabid')
-        
-        # Filter based on visualization type
-        if viz_type == 'cumulative':
-            filtered_df = merged_df[merged_df['year'] <= current_year]
-        else:  # time slice
-            year_start = current_year - 5 + 1  # using a fixed 5-year window for graph
-            filtered_df = merged_df[
-                (merged_df['year'] >= year_start) & 
-                (merged_df['year'] <= current_year)
-            ]
-        
-        # Aggregate places by year
-        yearly_places = filtered_df.groupby('year').size().reset_index(name='place_count')
+        year_start = current_year - 5 + 1  # using a fixed 5-year window for graph
+        if year_range and (current_year < year_range['min_year'] or
+                           (viz_type != 'cumulative' and year_start > year_range['max_year'])):
+            # No books in the window, so no need to decode the store
+            yearly_places = pd.DataFrame({'year': [], 'place_count': []})
+        else:
+            # Places with their book year, joined once in update_filtered_data
+            merged_df = store_to_df(merged_data)
+            
+            # Filter based on visualization type
+            if viz_type == 'cumulative':
+                filtered_df = merged_df[merged_df['year'] <= current_year]
+            else:  # time slice
+                filtered_df = merged_df[
+                    (merged_df['year'] >= year_start) & 
+                    (merged_df['year'] <= current_year)
+                ]
+            
+            # Aggregate places by year
+            yearly_places = filtered_df.groupby('year').size().reset_index(name='place_count')
         
         # Create the figure
-        import plotly.graph_objs as go
-        
         return go.Figure(
             data=[go.Bar(
                 x=yearly_places['year'], 